@@ -1,15 +1,663 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import cv2
+import numpy as np
 from PIL import Image, ImageTk
 import threading
+import queue
+import asyncio
+import inspect
+import argparse
 import json
+import csv
 import os
 import time  # 引入时间库用于延时
+import zlib
+import re
+import socket
 from pygrabber.dshow_graph import FilterGraph
 
 # 配置文件名称
 CONFIG_FILE = "cam_config.json"
+# 会话配置档 (通道-设备映射及已验证的打开参数)
+PROFILE_FILE = "cam_profiles.json"
+# 控制接口快照默认保存目录
+SNAPSHOT_DIR = "snapshots"
+# 帧时序报告默认保存目录
+REPORT_DIR = "reports"
+# 录像会话保存目录
+SESSION_DIR = "sessions"
+# 会话帧索引: 相对时间戳(秒), 在 chN.mjpg 中的字节偏移, JPEG 字节数
+FRAME_INDEX_DTYPE = np.dtype([("ts", "<f8"), ("offset", "<u8"), ("size", "<u4")])
+
+
+class FrameBuffer:
+    """池化的帧缓冲，引用计数归零后自动回到所属的 FramePool"""
+    __slots__ = ("pool", "array", "refs", "timestamp")
+
+    def __init__(self, pool, array):
+        self.pool = pool
+        self.array = array
+        self.refs = 0
+        self.timestamp = 0.0
+
+    def acquire(self):
+        # 交给显示/录制/快照等使用者前先加一次引用
+        with self.pool.lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with self.pool.lock:
+            if self.refs <= 0:
+                # 重复释放会让同一块内存两次进入空闲列表，被两个使用者同时拿到
+                print("FrameBuffer 重复释放，已忽略")
+                return
+            self.refs -= 1
+            if self.refs > 0:
+                return
+        self.pool._recycle(self)
+
+
+class FramePool:
+    """每个通道一组预分配的帧缓冲，cap.read 直接写入，避免每帧重新分配内存"""
+
+    def __init__(self, width, height, prealloc=3):
+        self.shape = (height, width, 3)
+        self.lock = threading.Lock()
+        self.allocated = 0
+        self.free = [self._alloc() for _ in range(prealloc)]
+
+    def _alloc(self):
+        self.allocated += 1
+        return FrameBuffer(self, np.empty(self.shape, dtype=np.uint8))
+
+    def get(self):
+        """取一个空闲缓冲 (引用计数为 1)，池空时才新分配"""
+        with self.lock:
+            buf = self.free.pop() if self.free else self._alloc()
+            buf.refs = 1
+        return buf
+
+    def read(self, cap):
+        """等价于 cap.read()，但帧数据写入池内缓冲；失败返回 (False, None)"""
+        return self._fill(cap.read)
+
+    def retrieve(self, cap):
+        """等价于 grab() 之后的 cap.retrieve()，同样写入池内缓冲"""
+        return self._fill(cap.retrieve)
+
+    def _fill(self, reader):
+        buf = self.get()
+        try:
+            ret, out = reader(buf.array)
+        except:
+            buf.release()
+            raise
+        if not ret or out is None:
+            buf.release()
+            return False, None
+        if out is not buf.array:
+            self._adopt(buf, out)
+        buf.timestamp = time.perf_counter()
+        return True, buf
+
+    def _adopt(self, buf, out):
+        # 驱动实际输出的尺寸和配置不一致时 OpenCV 会另行分配，
+        # 此时以实际尺寸为准，旧尺寸的空闲缓冲直接丢弃
+        with self.lock:
+            if out.shape != self.shape:
+                self.shape = out.shape
+                self.free = []
+        buf.array = out
+
+    def _recycle(self, buf):
+        with self.lock:
+            # 不限制空闲数量：总数只取决于同时在用的峰值 (显示 + 录制队列)，
+            # 丢弃多余缓冲反而会在下一次高峰时重新分配
+            if buf.array.shape == self.shape:
+                self.free.append(buf)
+
+
+def crop_roi(frame, roi):
+    """按归一化区域 (x0, y0, x1, y1) 裁出视图 (不复制)；roi 为 None 时原样返回"""
+    if roi is None:
+        return frame
+    src_h, src_w = frame.shape[:2]
+    x0 = min(int(roi[0] * src_w), src_w - 1)
+    y0 = min(int(roi[1] * src_h), src_h - 1)
+    x1 = max(int(roi[2] * src_w), x0 + 1)
+    y1 = max(int(roi[3] * src_h), y0 + 1)
+    return frame[y0:y1, x0:x1]
+
+
+class DuplicateDetector:
+    """判断驱动是否把同一帧又返回了一次。
+
+    优先比较 CAP_PROP_POS_MSEC；驱动不提供或时间戳从不变化时，
+    退回到对图像稀疏抽样后做 CRC32。可信的驱动时间戳同时用作帧的采集时刻。
+    """
+    SAMPLE_GRID = 32
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """重新打开设备时调用，时间戳可信度和时钟偏移一并重新估计"""
+        self.last_ts = None
+        self.ts_changes = 0
+        self.ts_offset = None
+        self.force_redraw()
+
+    def force_redraw(self):
+        """画面被清空或放大区域变化时调用：下一帧即使是重复帧也要显示一次。
+        只影响重复判断，不动时间戳可信度和时钟偏移，帧时序报告不受影响"""
+        self.last_hash = None
+        self.force_next = True
+        self.forced_repeat = False
+
+    def check_timestamp(self, cap):
+        """grab 之后调用：True 为重复帧，False 为新帧，None 表示时间戳不可靠需要改用哈希"""
+        self.forced_repeat = False
+        try:
+            ts = cap.get(cv2.CAP_PROP_POS_MSEC)
+        except:
+            return None
+        if not ts or ts <= 0:
+            return None
+        # 至少见到两次变化才认为时间戳可信，防止驱动返回固定值
+        reliable = self.ts_changes >= 2
+        if ts == self.last_ts:
+            if reliable and self.force_next:
+                # 需要强制重绘：交给哈希判断 (last_hash 已清空必然通过)，但这仍是旧帧，不计采集
+                self.forced_repeat = True
+                return None
+            return True if reliable else None
+        if self.last_ts is not None:
+            self.ts_changes += 1
+            if ts < self.last_ts:
+                # 驱动时间戳回退 (如重新协商格式)，时钟偏移需要重新估计
+                self.ts_offset = None
+        self.last_ts = ts
+        if reliable:
+            self.force_next = False
+            return False
+        return None
+
+    def capture_time(self, t_poll):
+        """新帧的采集时刻：时间戳可信时把驱动时间换算到 perf_counter 时基，否则用 grab 返回的时刻"""
+        if self.ts_changes < 2 or self.last_ts is None:
+            return t_poll
+        ts = self.last_ts / 1000.0
+        # 驱动时间戳总早于 grab 返回，取历史最小差值作为两个时钟之间的偏移
+        if self.ts_offset is None or t_poll - ts < self.ts_offset:
+            self.ts_offset = t_poll - ts
+        return ts + self.ts_offset
+
+    def check_hash(self, frame, roi=None):
+        """对抽样像素做 CRC32，与上一帧相同即视为重复；放大查看时只对显示的区域抽样"""
+        if frame.ndim < 3 or frame.shape[0] == 1:
+            # 未解码的 MJPG 码流 (1xN)：字节位置与画面无关，抽样会落在固定的文件头或码流之外，
+            # 压缩数据本身很小，直接对整块做 CRC
+            digest = zlib.crc32(np.ascontiguousarray(frame))
+        else:
+            # 10 倍放大时全图 32x32 的抽样点只有约 3x3 落在区域内，区域里的变化容易漏掉
+            frame = crop_roi(frame, roi)
+            h, w = frame.shape[:2]
+            sample = frame[::max(h // self.SAMPLE_GRID, 1), ::max(w // self.SAMPLE_GRID, 1)]
+            digest = zlib.crc32(np.ascontiguousarray(sample))
+        duplicate = digest == self.last_hash
+        self.last_hash = digest
+        self.force_next = False
+        return duplicate
+
+
+class FrameTimingRecorder:
+    """逐帧时序记录器。
+
+    每个通道用固定长度的 NumPy 环形数组保存采集时刻和显示时刻，热路径只写两个数；
+    每满一块就把更早一块汇总进直方图和最长间隔列表，因此无论运行多久内存都不变。
+    驱动送来的每个新帧都记录采集时刻，未显示的帧 (如缩略图通道丢弃的帧) 显示时刻为空；
+    驱动重复返回的同一帧不算新帧，只计数。
+    """
+    CAPACITY = 1 << 16
+    BLOCK = 1024
+    BIN_MS = 0.1
+    MAX_MS = 1000.0
+    TOP_GAPS = 10
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self, channels=4, capacity=CAPACITY):
+        self.channels = channels
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.nbins = int(self.MAX_MS / self.BIN_MS)
+        self.reset()
+
+    def reset(self):
+        shape = (self.channels, self.capacity)
+        self.capture = np.zeros(shape, dtype=np.float64)
+        self.display = np.full(shape, np.nan, dtype=np.float64)
+        self.count = [0] * self.channels
+        self.duplicates = [0] * self.channels
+        # 已汇总到的帧序号 (不含)，以及汇总结果；最后一个 bin 收纳超过 MAX_MS 的值
+        self.flushed = [0] * self.channels
+        self.interval_hist = np.zeros((self.channels, self.nbins + 1), dtype=np.int64)
+        self.latency_hist = np.zeros((self.channels, self.nbins + 1), dtype=np.int64)
+        self.gaps = [[] for _ in range(self.channels)]
+        self.started = time.perf_counter()
+
+    def record_capture(self, ch, t):
+        """记录一帧的采集时刻，返回帧序号供 record_display 使用"""
+        seq = self.count[ch]
+        slot = seq & self.mask
+        self.capture[ch, slot] = t
+        self.display[ch, slot] = np.nan
+        self.count[ch] = seq + 1
+        # 滞后一块再汇总，保证那一块的显示时刻都已写入
+        if (seq + 1) % self.BLOCK == 0 and seq + 1 - self.flushed[ch] >= 2 * self.BLOCK:
+            self._flush(ch, seq + 1 - self.BLOCK)
+        return seq
+
+    def record_duplicate(self, ch):
+        self.duplicates[ch] += 1
+
+    def record_display(self, ch, seq, t):
+        if self.count[ch] - seq <= self.capacity:
+            self.display[ch, seq & self.mask] = t
+
+    def _block(self, ch, start, end):
+        """计算帧序号 [start, end) 的帧间隔、采集到显示延迟和对应时刻 (单位 ms / s)"""
+        # 带上前一帧才能算出 start 这一帧的间隔；第 0 帧之前没有帧
+        first = max(start - 1, 0)
+        idx = np.arange(first, end) & self.mask
+        cap = self.capture[ch, idx]
+        intervals = np.diff(cap) * 1000.0
+        at = cap[1:] - self.started
+        skip = start - first
+        latency = (self.display[ch, idx[skip:]] - cap[skip:]) * 1000.0
+        latency = latency[~np.isnan(latency)]
+        return intervals, at, latency
+
+    def _center(self, k):
+        # 百分位和抖动统一取 bin 中心值，避免两者一个用上沿一个用中心而产生系统偏差
+        return (k + 0.5) * self.BIN_MS
+
+    def _bin(self, values_ms):
+        bins = np.clip((values_ms / self.BIN_MS).astype(np.int64), 0, self.nbins)
+        return np.bincount(bins, minlength=self.nbins + 1)
+
+    def _merge_gaps(self, gaps, intervals, at):
+        if intervals.size:
+            k = min(self.TOP_GAPS, intervals.size)
+            top = np.argpartition(intervals, -k)[-k:]
+            gaps = gaps + [(float(intervals[j]), float(at[j])) for j in top]
+        return sorted(gaps, reverse=True)[:self.TOP_GAPS]
+
+    def _flush(self, ch, end):
+        start = self.flushed[ch]
+        # 环形数组已被覆盖的部分无法再汇总，直接跳过
+        start = max(start, self.count[ch] - self.capacity + 1)
+        if end <= start:
+            return
+        intervals, at, latency = self._block(ch, start, end)
+        self.interval_hist[ch] += self._bin(intervals)
+        self.latency_hist[ch] += self._bin(latency)
+        self.gaps[ch] = self._merge_gaps(self.gaps[ch], intervals, at)
+        self.flushed[ch] = end
+
+    def _percentiles(self, hist):
+        total = int(hist.sum())
+        if total == 0:
+            return {}
+        cum = np.cumsum(hist)
+        result = {}
+        for p in self.PERCENTILES:
+            k = int(np.searchsorted(cum, total * p / 100.0))
+            result[f"p{p:g}"] = round(self._center(k), 3)
+        return result
+
+    def _jitter(self, hist, median_ms):
+        """抖动：帧间隔偏离中位数的绝对值分布"""
+        total = int(hist.sum())
+        if total == 0:
+            return {}
+        centers = self._center(np.arange(self.nbins + 1))
+        deviation = np.abs(centers - median_ms)
+        order = np.argsort(deviation)
+        cum = np.cumsum(hist[order])
+        result = {}
+        for p in self.PERCENTILES:
+            k = int(np.searchsorted(cum, total * p / 100.0))
+            result[f"p{p:g}"] = round(float(deviation[order[min(k, len(order) - 1)]]), 3)
+        return result
+
+    def report(self, ch):
+        """单通道报告；尚未汇总的尾部临时算入，不改变已汇总的数据"""
+        start = max(self.flushed[ch], self.count[ch] - self.capacity + 1)
+        interval_hist = self.interval_hist[ch].copy()
+        latency_hist = self.latency_hist[ch].copy()
+        gaps = self.gaps[ch]
+        if self.count[ch] > start:
+            intervals, at, latency = self._block(ch, start, self.count[ch])
+            interval_hist += self._bin(intervals)
+            latency_hist += self._bin(latency)
+            gaps = self._merge_gaps(gaps, intervals, at)
+
+        interval_pct = self._percentiles(interval_hist)
+        median = interval_pct.get("p50", 0.0)
+        return {
+            "channel": ch,
+            "frames": self.count[ch],
+            "displayed": int(latency_hist.sum()),
+            "duplicates": self.duplicates[ch],
+            "intervals": int(interval_hist.sum()),
+            "interval_ms": interval_pct,
+            "jitter_ms": self._jitter(interval_hist, median),
+            "latency_ms": self._percentiles(latency_hist),
+            "longest_gaps": [{"gap_ms": round(g, 3), "at_s": round(a, 3)} for g, a in gaps],
+            "interval_hist": interval_hist,
+            "latency_hist": latency_hist,
+        }
+
+    def export(self, path, channels=None):
+        """导出整个会话的报告：timing.json (含直方图) 与 timing_summary.csv / timing_histogram.csv"""
+        os.makedirs(path, exist_ok=True)
+        channels = range(self.channels) if channels is None else channels
+        reports = [self.report(ch) for ch in channels if self.count[ch] > 0]
+
+        def sparse(hist):
+            nz = np.nonzero(hist)[0]
+            return [[round(float(k * self.BIN_MS), 3), int(hist[k])] for k in nz]
+
+        data = {"bin_ms": self.BIN_MS, "duration_s": round(time.perf_counter() - self.started, 3), "channels": []}
+        for r in reports:
+            item = {k: v for k, v in r.items() if not k.endswith("_hist")}
+            item["interval_hist"] = sparse(r["interval_hist"])
+            item["latency_hist"] = sparse(r["latency_hist"])
+            data["channels"].append(item)
+        with open(os.path.join(path, "timing.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+
+        keys = ["p%g" % p for p in self.PERCENTILES]
+        with open(os.path.join(path, "timing_summary.csv"), "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["channel", "frames", "displayed", "duplicates"]
+                            + [f"interval_{k}_ms" for k in keys]
+                            + [f"jitter_{k}_ms" for k in keys]
+                            + [f"latency_{k}_ms" for k in keys]
+                            + ["longest_gap_ms", "longest_gap_at_s"])
+            for r in reports:
+                gap = r["longest_gaps"][0] if r["longest_gaps"] else {"gap_ms": "", "at_s": ""}
+                writer.writerow([r["channel"], r["frames"], r["displayed"], r["duplicates"]]
+                                + [r["interval_ms"].get(k, "") for k in keys]
+                                + [r["jitter_ms"].get(k, "") for k in keys]
+                                + [r["latency_ms"].get(k, "") for k in keys]
+                                + [gap["gap_ms"], gap["at_s"]])
+
+        with open(os.path.join(path, "timing_histogram.csv"), "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["channel", "kind", "bin_start_ms", "bin_end_ms", "count"])
+            for r in reports:
+                for kind in ("interval", "latency"):
+                    for start_ms, n in sparse(r[f"{kind}_hist"]):
+                        writer.writerow([r["channel"], kind, start_ms, round(start_ms + self.BIN_MS, 3), n])
+        return path
+
+
+class ChannelStats:
+    """单路画面的运行统计，实时采集和会话回放共用"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.reduced = 0
+        self.full_samples = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.fps = 0.0
+        self.render_ms = 0.0
+        self.cpu_ms = 0.0
+        self.saved_ms = 0.0
+        self._win_start = time.perf_counter()
+        self._win_frames = 0
+        self._win_cpu = 0.0
+        self._win_saved = 0.0
+
+    def on_frame(self, cost, reduced=False):
+        """cost 为读取到显示完成的耗时(秒)；reduced 表示缩略图的低分辨率路径"""
+        self.frames += 1
+        self._win_frames += 1
+        self._win_cpu += cost
+        if reduced:
+            self.reduced += 1
+            self._win_saved += max(self.render_ms / 1000.0 - cost, 0.0)
+        elif self.full_samples == 0:
+            # 第一帧直接作为基准，不从 0 开始平滑
+            self.full_samples = 1
+            self.render_ms = cost * 1000.0
+        else:
+            # 全质量单帧耗时做指数平滑，避免数字跳动
+            self.full_samples += 1
+            self.render_ms = self.render_ms * 0.9 + cost * 1000.0 * 0.1
+        self._roll()
+
+    def on_skip(self, cost):
+        """缩略图通道非显示时刻只 grab 不解码，按全质量耗时估算节省的 CPU"""
+        self.skipped += 1
+        self._win_cpu += cost
+        self._win_saved += max(self.render_ms / 1000.0 - cost, 0.0)
+        self._roll()
+
+    def on_duplicate(self, cost):
+        """驱动重复返回的旧帧，跳过转色/缩放/显示"""
+        self.duplicates += 1
+        self._win_cpu += cost
+        self._win_saved += max(self.render_ms / 1000.0 - cost, 0.0)
+        self._roll()
+
+    def _roll(self):
+        now = time.perf_counter()
+        elapsed = now - self._win_start
+        if elapsed >= 1.0:
+            self.fps = self._win_frames / elapsed
+            self.cpu_ms = self._win_cpu * 1000.0 / elapsed
+            self.saved_ms = self._win_saved * 1000.0 / elapsed
+            self._win_start = now
+            self._win_frames = 0
+            self._win_cpu = 0.0
+            self._win_saved = 0.0
+
+    def as_dict(self):
+        return {"frames": self.frames, "reduced": self.reduced, "skipped": self.skipped,
+                "duplicates": self.duplicates,
+                "fps": round(self.fps, 2), "render_ms": round(self.render_ms, 2),
+                "cpu_ms_per_s": round(self.cpu_ms, 1), "saved_ms_per_s": round(self.saved_ms, 1)}
+
+    def summary(self):
+        text = f"{self.fps:4.1f}fps {self.render_ms:4.1f}ms cpu {self.cpu_ms:4.0f}ms/s"
+        if self.duplicates:
+            text += f" 重复 {self.duplicates}"
+        if self.saved_ms > 0.5:
+            text += f" 省 {self.saved_ms:.0f}ms/s"
+        return text
+
+
+class SessionRecorder:
+    """录制会话：各通道画面编码为 JPEG 顺序写入 chN.mjpg，并追加 chN.idx 帧索引"""
+
+    def __init__(self, path, channels, quality=85):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.queue = queue.Queue(maxsize=32)
+        self.dropped = 0
+        self.error = None
+        self.files = {}
+        for ch in channels:
+            data_f = open(os.path.join(path, f"ch{ch}.mjpg"), "wb")
+            idx_f = open(os.path.join(path, f"ch{ch}.idx"), "wb")
+            self.files[ch] = (data_f, idx_f)
+
+        meta = {
+            "version": 1,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "channels": sorted(channels),
+        }
+        with open(os.path.join(path, "session.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=4)
+
+        self.t0 = time.perf_counter()
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def submit(self, ch, buf):
+        """在采集线程调用，只加引用入队，编码和写盘都在后台线程完成"""
+        if ch not in self.files or self.error:
+            return
+        buf.acquire()
+        try:
+            self.queue.put_nowait((ch, buf, buf.timestamp - self.t0))
+        except queue.Full:
+            # 磁盘跟不上时丢帧，不能拖慢显示
+            buf.release()
+            self.dropped += 1
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            ch, buf, ts = item
+            try:
+                ok, enc = cv2.imencode(".jpg", buf.array, self.params)
+            except Exception as e:
+                print(f"录制编码失败: {e}")
+                ok = False
+            finally:
+                buf.release()
+            if not ok or self.error:
+                continue
+            data_f, idx_f = self.files[ch]
+            try:
+                offset = data_f.tell()
+                data_f.write(enc.tobytes())
+                # 先写数据再写索引，写盘失败时索引只会缺少最后一帧
+                entry = np.array([(ts, offset, enc.size)], dtype=FRAME_INDEX_DTYPE)
+                idx_f.write(entry.tobytes())
+            except Exception as e:
+                # 磁盘满等错误：停止写入，但线程继续消费队列，close() 不会卡死
+                self.error = str(e)
+                print(f"录制写盘失败: {e}")
+
+    def close(self):
+        try:
+            self.queue.put(None, timeout=5)
+        except queue.Full:
+            self.error = self.error or "录制线程无响应"
+        self.thread.join(timeout=5)
+        for data_f, idx_f in self.files.values():
+            for f in (data_f, idx_f):
+                try:
+                    f.close()
+                except Exception as e:
+                    print(f"关闭录制文件失败: {e}")
+        if self.dropped:
+            print(f"录制结束，丢弃 {self.dropped} 帧")
+
+
+class ReplaySource:
+    """按帧索引随机访问已保存的会话，各通道共用同一条时间轴"""
+    SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0)
+
+    def __init__(self, path):
+        with open(os.path.join(path, "session.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.channels = {}
+        for ch in self.meta.get("channels", []):
+            idx_path = os.path.join(path, f"ch{ch}.idx")
+            data_path = os.path.join(path, f"ch{ch}.mjpg")
+            if not os.path.exists(idx_path) or not os.path.exists(data_path):
+                continue
+            # 录制中断时最后一条索引可能不完整，按整条截断
+            raw = np.fromfile(idx_path, dtype=np.uint8)
+            count = raw.size // FRAME_INDEX_DTYPE.itemsize
+            if count == 0:
+                continue
+            index = raw[:count * FRAME_INDEX_DTYPE.itemsize].view(FRAME_INDEX_DTYPE)
+            ts = np.ascontiguousarray(index["ts"])
+            # 不做内存映射：长时间录像单路可达数十 GB，32 位版本的地址空间放不下；
+            # 有索引就能直接定位，每帧按偏移读出即可
+            data = open(data_path, "rb")
+            self.channels[ch] = (ts, index, data)
+
+        if not self.channels:
+            raise ValueError("会话中没有可回放的通道")
+        self.start = min(ts[0] for ts, _, _ in self.channels.values())
+        self.end = max(ts[-1] for ts, _, _ in self.channels.values())
+
+    def frames_at(self, t):
+        """返回 {通道: 帧序号}，即每路在时刻 t 应显示的最后一帧 (二分查找)"""
+        result = {}
+        for ch, (ts, _, _) in self.channels.items():
+            k = int(np.searchsorted(ts, t, side="right")) - 1
+            if k >= 0:
+                result[ch] = k
+        return result
+
+    def decode(self, ch, k):
+        _, index, data = self.channels[ch]
+        data.seek(int(index["offset"][k]))
+        buf = data.read(int(index["size"][k]))
+        if not buf:
+            return None
+        return cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def close(self):
+        for _, _, data in self.channels.values():
+            data.close()
+        self.channels = {}
+
+    def next_time(self, t):
+        """所有通道中 t 之后最近的一帧时刻，用于逐帧前进"""
+        candidates = []
+        for ts, _, _ in self.channels.values():
+            k = int(np.searchsorted(ts, t, side="right"))
+            if k < len(ts):
+                candidates.append(ts[k])
+        return float(min(candidates)) if candidates else None
+
+    def prev_time(self, t):
+        """所有通道中 t 之前最近的一帧时刻，用于逐帧后退"""
+        candidates = []
+        for ts, _, _ in self.channels.values():
+            k = int(np.searchsorted(ts, t, side="left")) - 1
+            if k >= 0:
+                candidates.append(ts[k])
+        return float(max(candidates)) if candidates else None
+
+
+def enumerate_devices():
+    """枚举 DirectShow 视频设备，返回 {"编号: 名称": 编号}；可在工作线程中调用"""
+    worker = threading.current_thread() is not threading.main_thread()
+    if worker:
+        # 工作线程需要自己初始化 COM
+        import comtypes
+        comtypes.CoInitialize()
+    try:
+        devices = FilterGraph().get_input_devices()
+    finally:
+        if worker:
+            comtypes.CoUninitialize()
+    return {f"{i}: {name}": i for i, name in enumerate(devices)}
+
+
+def device_base_name(full_dev_name):
+    return full_dev_name.split(": ", 1)[-1] if ": " in full_dev_name else full_dev_name
+
 
 class ConfigManager:
     @staticmethod
@@ -32,6 +680,27 @@ class ConfigManager:
         except Exception as e:
             print(f"保存配置失败: {e}")
 
+class ProfileManager:
+    @staticmethod
+    def load_profiles():
+        if os.path.exists(PROFILE_FILE):
+            try:
+                with open(PROFILE_FILE, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {}
+
+    @staticmethod
+    def save_profile(name, profile):
+        data = ProfileManager.load_profiles()
+        data[name] = profile
+        try:
+            with open(PROFILE_FILE, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+        except Exception as e:
+            print(f"保存配置档失败: {e}")
+
 class CameraConfigPane:
     def __init__(self, parent, index, app_instance):
         self.index = index
@@ -58,10 +727,11 @@ class CameraConfigPane:
         self.lbl_status = tk.Label(self.frame, text="等待配置", fg="gray", font=("Arial", 8))
         self.lbl_status.pack(anchor="w")
 
-    def update_device_list(self, devices_dict):
+    def update_device_list(self, devices_dict, autoselect=True):
         device_names = list(devices_dict.keys())
         self.combo_device['values'] = device_names
-        if device_names and self.index < len(device_names):
+        # 按配置档启动时只更新列表，不自动选择 (否则会触发扫描去打开正在使用的设备)
+        if autoselect and device_names and self.index < len(device_names):
             if not self.combo_device.get():
                 self.combo_device.current(self.index)
                 self.on_device_selected(None)
@@ -71,7 +741,7 @@ class CameraConfigPane:
         if not full_dev_name:
             return
             
-        clean_name = full_dev_name.split(": ", 1)[-1] if ": " in full_dev_name else full_dev_name
+        clean_name = device_base_name(full_dev_name)
         cached_data = ConfigManager.load_config()
         
         if clean_name in cached_data and len(cached_data[clean_name]) > 0:
@@ -95,6 +765,7 @@ class CameraConfigPane:
         ]
 
         available_options = []
+        frame_buf = None # 扫描期间复用同一块缓冲
         cap = cv2.VideoCapture() # 先初始化对象
         
         # --- 重试打开逻辑 ---
@@ -130,7 +801,9 @@ class CameraConfigPane:
                         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
                         
                         # 必须读取，且给一点点缓冲
-                        cap.read() 
+                        ret, frame = cap.read(frame_buf)
+                        if ret:
+                            frame_buf = frame
                         
                         act_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
                         act_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
@@ -159,6 +832,26 @@ class CameraConfigPane:
 
         self.app.root.after(0, finish_scan)
 
+    def set_selection(self, device, res, enabled=True):
+        """直接设定设备和分辨率，不触发设备扫描"""
+        self.var_enable.set(enabled)
+        devices = list(self.combo_device['values'])
+        if device not in devices:
+            self.combo_device['values'] = devices + [device]
+        self.var_device.set(device)
+        options = list(self.combo_res['values'])
+        if res not in options:
+            self.combo_res['values'] = options + [res]
+        self.var_res.set(res)
+
+    def apply_profile_entry(self, entry):
+        """按配置档直接回填界面"""
+        if not entry:
+            self.var_enable.set(False)
+            return
+        self.set_selection(entry['device'], entry['res'])
+        self.lbl_status.config(text="配置档启动，等待首帧", fg="orange")
+
     def get_config(self):
         if not self.var_enable.get():
             return None
@@ -189,19 +882,306 @@ class CameraConfigPane:
         return config
 
 
+class InvalidParams(ValueError):
+    """控制接口参数不合法，返回 JSON-RPC -32602 而不是一般的执行错误"""
+
+
+class ControlServer:
+    """本地控制接口：asyncio 实现的 JSON-RPC 2.0，每行一个请求/响应 (支持批量请求数组)。
+
+    网络收发在独立线程的事件循环中进行，命令排队交给 Tk 主线程执行，
+    不会阻塞采集和显示刷新。
+    """
+
+    def __init__(self, app, port=None, unix_path=None, host="127.0.0.1"):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.loop = None
+        self.servers = []
+        self.calls = queue.Queue()
+        self.methods = {
+            "list_devices": self.rpc_list_devices,
+            "get_config": self.rpc_get_config,
+            "apply_config": self.rpc_apply_config,
+            "start": self.rpc_start,
+            "stop": self.rpc_stop,
+            "snapshot": self.rpc_snapshot,
+            "stats": self.rpc_stats,
+            "timing_report": self.rpc_timing_report,
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.app.root.after(10, self._drain_calls)
+
+    def stop(self):
+        """关闭监听并删除 Unix socket 文件，下次可用同一路径重新启动"""
+        if self.loop and self.loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=2)
+            except Exception as e:
+                print(f"关闭控制接口出错: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._unlink_socket()
+
+    async def _shutdown(self):
+        for server in self.servers:
+            server.close()
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+
+    def _unlink_socket(self):
+        if self.unix_path and os.path.exists(self.unix_path):
+            try:
+                os.unlink(self.unix_path)
+            except OSError as e:
+                print(f"删除 {self.unix_path} 失败: {e}")
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # 每个监听各自处理失败，一个起不来不影响另一个已经接入的客户端
+        if self.port is not None:
+            try:
+                server = self.loop.run_until_complete(asyncio.start_server(self._handle_client, self.host, self.port))
+                self.servers.append(server)
+                print(f"控制接口监听 {self.host}:{self.port}")
+            except Exception as e:
+                print(f"控制接口端口 {self.port} 启动失败: {e}")
+        if self.unix_path:
+            try:
+                # 上次异常退出残留的 socket 文件会导致 address in use
+                self._unlink_socket()
+                server = self.loop.run_until_complete(asyncio.start_unix_server(self._handle_client, self.unix_path))
+                self.servers.append(server)
+                print(f"控制接口监听 {self.unix_path}")
+            except Exception as e:
+                print(f"控制接口 {self.unix_path} 启动失败: {e}")
+        if not self.servers:
+            self.loop.close()
+            return
+        self.loop.run_forever()
+
+    # --- Tk 主线程一侧 ---
+
+    def _drain_calls(self):
+        while True:
+            try:
+                fn, args, fut = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                result, error = fn(*args), None
+            except Exception as e:
+                result, error = None, e
+            self.loop.call_soon_threadsafe(self._resolve, fut, result, error)
+        self.app.root.after(10, self._drain_calls)
+
+    @staticmethod
+    def _resolve(fut, result, error):
+        if fut.cancelled():
+            return
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+    def call_in_ui(self, fn, *args):
+        """在事件循环中调用：把 fn 排队到 Tk 主线程执行，返回可 await 的结果"""
+        fut = self.loop.create_future()
+        self.calls.put((fn, args, fut))
+        return fut
+
+    # --- 事件循环一侧 ---
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self._dispatch(line)
+                if response is not None:
+                    writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _error(req_id, code, message):
+        return {"jsonrpc": "2.0", "id": req_id, "error": {"code": code, "message": message}}
+
+    async def _dispatch(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return self._error(None, -32700, "Parse error")
+        if isinstance(request, list):
+            # 批量请求：逐条按顺序执行 (命令本身要排队到主线程)，只回复非通知的条目
+            if not request:
+                return self._error(None, -32600, "Invalid Request")
+            responses = [await self._dispatch_one(item) for item in request]
+            responses = [r for r in responses if r is not None]
+            return responses or None
+        return await self._dispatch_one(request)
+
+    async def _dispatch_one(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return self._error(None, -32600, "Invalid Request")
+
+        req_id = request.get("id")
+        # 通知类请求 (没有 id) 无论成败都不回复
+        notification = "id" not in request
+        method = self.methods.get(request["method"])
+        if method is None:
+            return None if notification else self._error(req_id, -32601, f"Method not found: {request['method']}")
+
+        params = request.get("params") or {}
+        if not isinstance(params, (list, dict)):
+            return None if notification else self._error(req_id, -32602, "Invalid params")
+        args, kwargs = (params, {}) if isinstance(params, list) else ([], params)
+        try:
+            inspect.signature(method).bind(*args, **kwargs)
+        except TypeError as e:
+            return None if notification else self._error(req_id, -32602, f"Invalid params: {e}")
+
+        t0 = time.perf_counter()
+        try:
+            result = await method(*args, **kwargs)
+        except InvalidParams as e:
+            return None if notification else self._error(req_id, -32602, f"Invalid params: {e}")
+        except Exception as e:
+            return None if notification else self._error(req_id, -32000, str(e))
+        if notification:
+            return None
+        if isinstance(result, dict):
+            result["elapsed_ms"] = (time.perf_counter() - t0) * 1000.0
+        return {"jsonrpc": "2.0", "id": req_id, "result": result}
+
+    async def _ensure_devices(self, refresh=False):
+        # 设备枚举 (COM) 放到线程池，主线程只接收结果，不阻塞采集和显示
+        if refresh or not self.app.devices_dict:
+            devices = await self.loop.run_in_executor(None, enumerate_devices)
+            await self.call_in_ui(self.app.apply_devices, devices, False)
+
+    async def rpc_list_devices(self, refresh=False):
+        await self._ensure_devices(refresh)
+        return await self.call_in_ui(self.app.api_list_devices)
+
+    async def rpc_get_config(self):
+        return await self.call_in_ui(self.app.api_get_config)
+
+    async def rpc_apply_config(self, channels):
+        await self._ensure_devices()
+        return await self.call_in_ui(self.app.api_apply_config, channels)
+
+    async def rpc_start(self, profile=None):
+        return await self.call_in_ui(self.app.api_start, profile)
+
+    async def rpc_stop(self):
+        return await self.call_in_ui(self.app.api_stop)
+
+    async def rpc_stats(self):
+        return await self.call_in_ui(self.app.api_stats)
+
+    async def rpc_timing_report(self, path=None):
+        return await self.call_in_ui(self.app.api_timing_report, path)
+
+    async def rpc_snapshot(self, path=None):
+        """同步快照：主线程只做 grab/retrieve，编码写盘放到线程池"""
+        path = path or os.path.join(SNAPSHOT_DIR, time.strftime("%Y%m%d_%H%M%S"))
+        frames = await self.call_in_ui(self.app.api_grab_snapshot)
+        try:
+            files = await self.loop.run_in_executor(None, self._write_snapshot, path, frames)
+        finally:
+            for _, buf in frames:
+                buf.release()
+        stamps = [buf.timestamp for _, buf in frames]
+        skew = (max(stamps) - min(stamps)) * 1000.0 if stamps else 0.0
+        return {"path": path, "files": files, "skew_ms": skew}
+
+    @staticmethod
+    def _write_snapshot(path, frames):
+        os.makedirs(path, exist_ok=True)
+        files = []
+        for i, buf in frames:
+            file_path = os.path.join(path, f"ch{i}.png")
+            # imencode + tofile 以支持中文路径
+            ok, enc = cv2.imencode(".png", buf.array)
+            if ok:
+                enc.tofile(file_path)
+                files.append(file_path)
+        return files
+
+
 class MultiCamApp:
-    def __init__(self, root):
+    def __init__(self, root, profile=None):
         self.root = root
         self.root.title("多路监控系统 - 稳定增强版")
         self.root.geometry("1200x700")
         
         self.is_running = False
         self.caps = [None] * 4
+        self.frame_pools = [None] * 4
+        self.rgb_bufs = [None] * 4
+        self.channel_settings = [None] * 4
+        # 快速启动的通道在首帧到达前处于待验证状态: (期望尺寸, 截止时间)
+        self.pending_verify = [None] * 4
+        self.last_start_ms = None
+        self._loop_job = None
+        self.control = None
+
+        # 聚焦模式：一路全速全质量，其余降为低帧率缩略图
+        self.focus_channel = None
+        self.next_thumb = [0.0] * 4
+        self.thumb_bufs = [None] * 4
+        # 缩略图通道对 MJPG 关闭驱动端转换，取原始数据做 1/4 缩小解码
+        self.raw_decode = [False] * 4
+        self.raw_supported = [True] * 4
+        self.dup_detectors = [DuplicateDetector() for _ in range(4)]
+        self.timing = FrameTimingRecorder(4)
+
+        # 局部放大：rois 为源图上的归一化区域 (x0, y0, x1, y1)，None 表示全图
+        self.rois = [None] * 4
+        # 最近一次绘制的映射 (pos_x, pos_y, new_w, new_h, roi)，用于把鼠标坐标换算回源图
+        self.view_maps = [None] * 4
+        # 最近一次显示的标签尺寸 BGR 画面 (不含框选框)，拖拽时据此重画，不必等新帧
+        self.view_imgs = [None] * 4
+        # 正在拖拽的框选区域 (标签坐标)
+        self.drags = [None] * 4
+        self.stats = [ChannelStats() for _ in range(4)]
         self.devices_dict = {} 
 
+        # 录制 / 回放状态
+        self.recorder = None
+        self.replay = None
+        self.replay_playing = False
+        self.replay_speed = 1.0
+        self.replay_pos = 0.0
+        self.replay_origin = 0.0
+        self.replay_wall = 0.0
+        self.replay_shown = {}
+        self._replay_job = None
+
+        # 按配置档启动的通道对应的条目，设备枚举完成后据此核对设备名
+        self.profile_entries = [None] * 4
+
         self._init_gui()
-        # 延时一点启动，避免 pygrabber 和 UI 抢占资源
-        self.root.after(800, self.refresh_devices)
+        if profile:
+            # 指定了配置档：直接打开，设备枚举放到后台，不做逐个面板的重新选择
+            self.root.after(100, lambda: self.launch_profile(profile))
+        else:
+            # 延时一点启动，避免 pygrabber 和 UI 抢占资源
+            self.root.after(800, self.refresh_devices)
+        self.root.after(1000, self.update_telemetry)
 
     def _init_gui(self):
         top_frame = tk.Frame(self.root, pady=10)
@@ -222,20 +1202,179 @@ class MultiCamApp:
 
         btn_refresh = tk.Button(btn_frame, text="⟳ 强制重新扫描", command=self.force_rescan)
         btn_refresh.pack(fill="x")
+
+        self.btn_record = tk.Button(btn_frame, text="● 开始录制", command=self.toggle_recording, state="disabled")
+        self.btn_record.pack(fill="x", pady=(5, 0))
+
+        btn_replay = tk.Button(btn_frame, text="⏏ 打开回放", command=self.open_replay)
+        btn_replay.pack(fill="x", pady=(5, 0))
+
+        btn_timing = tk.Button(btn_frame, text="导出时序报告", command=self.export_timing)
+        btn_timing.pack(fill="x", pady=(5, 0))
+
+        tk.Label(btn_frame, text="配置档:").pack(anchor="w", pady=(8, 0))
+        self.var_profile = tk.StringVar()
+        self.combo_profile = ttk.Combobox(btn_frame, textvariable=self.var_profile, state="readonly", width=16)
+        self.combo_profile.pack(fill="x")
+        self.refresh_profiles()
+
+        btn_warm = tk.Button(btn_frame, text="⚡ 按配置档快速启动", command=self.warm_start)
+        btn_warm.pack(fill="x", pady=(2, 0))
+
+        self.btn_save_profile = tk.Button(btn_frame, text="保存为配置档", command=self.save_profile, state="disabled")
+        self.btn_save_profile.pack(fill="x", pady=(2, 0))
+
+        # 底部状态栏：各通道帧率/耗时
+        self.status_bar = tk.Frame(self.root)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.lbl_telemetry = tk.Label(self.status_bar, text="", anchor="w", font=("Consolas", 9), fg="#333")
+        self.lbl_telemetry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.var_thumb_fps = tk.DoubleVar(value=5)
+        tk.Spinbox(self.status_bar, from_=1, to=15, increment=1, width=4,
+                   textvariable=self.var_thumb_fps).pack(side=tk.RIGHT, padx=(0, 5))
+        tk.Label(self.status_bar, text="缩略图帧率:", font=("Arial", 9)).pack(side=tk.RIGHT)
+
+        self._init_replay_bar()
         
         self.video_frame = tk.Frame(self.root, bg="black")
         self.video_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-        
-        self.video_frame.grid_rowconfigure(0, weight=1)
-        self.video_frame.grid_rowconfigure(1, weight=1)
-        self.video_frame.grid_columnconfigure(0, weight=1)
-        self.video_frame.grid_columnconfigure(1, weight=1)
 
         self.video_labels = []
         for i in range(4):
             lbl = tk.Label(self.video_frame, bg="black", text=f"通道 {i+1} 待机", fg="#666", font=("Arial", 16))
-            lbl.grid(row=i//2, column=i%2, sticky="nsew", padx=2, pady=2)
+            # 双击进入/退出聚焦模式；左键拖拽框选放大，右键恢复全图
+            lbl.bind("<Double-Button-1>", lambda e, idx=i: self.toggle_focus(idx))
+            lbl.bind("<ButtonPress-1>", lambda e, idx=i: self.on_roi_press(idx, e))
+            lbl.bind("<B1-Motion>", lambda e, idx=i: self.on_roi_drag(idx, e))
+            lbl.bind("<ButtonRelease-1>", lambda e, idx=i: self.on_roi_release(idx, e))
+            lbl.bind("<Button-3>", lambda e, idx=i: self.reset_roi(idx))
             self.video_labels.append(lbl)
+        self._layout_tiles()
+
+    def _layout_tiles(self):
+        for lbl in self.video_labels:
+            lbl.grid_forget()
+        for r in range(3):
+            self.video_frame.grid_rowconfigure(r, weight=0)
+        for c in range(2):
+            self.video_frame.grid_columnconfigure(c, weight=0, minsize=0)
+
+        if self.focus_channel is None:
+            # 默认 2x2 等分
+            for r in range(2):
+                self.video_frame.grid_rowconfigure(r, weight=1)
+            for c in range(2):
+                self.video_frame.grid_columnconfigure(c, weight=1)
+            for i, lbl in enumerate(self.video_labels):
+                lbl.grid(row=i//2, column=i%2, sticky="nsew", padx=2, pady=2)
+        else:
+            # 聚焦通道占左侧大画面，其余在右侧竖排缩略图
+            self.video_frame.grid_columnconfigure(0, weight=1)
+            self.video_frame.grid_columnconfigure(1, minsize=240)
+            for r in range(3):
+                self.video_frame.grid_rowconfigure(r, weight=1)
+            self.video_labels[self.focus_channel].grid(row=0, column=0, rowspan=3, sticky="nsew", padx=2, pady=2)
+            others = [i for i in range(4) if i != self.focus_channel]
+            for r, i in enumerate(others):
+                self.video_labels[i].grid(row=r, column=1, sticky="nsew", padx=2, pady=2)
+
+    def toggle_focus(self, i):
+        self.focus_channel = None if self.focus_channel == i else i
+        self.next_thumb = [0.0] * 4
+        for detector in self.dup_detectors:
+            # 画面会被清空，下一帧即使重复也要重新显示
+            detector.force_redraw()
+        for k in range(4):
+            # 清掉旧尺寸的画面，避免标签按旧图片撑大布局
+            self.rgb_bufs[k] = None
+            self.view_imgs[k] = None
+            if self.video_labels[k].cget("image"):
+                self.video_labels[k].config(image='')
+        self._layout_tiles()
+        if self.replay:
+            # 回放暂停时也要按新布局重绘当前帧
+            self.replay_shown = {}
+            self.root.after(50, lambda: self.replay and self._replay_show(self.replay_pos))
+
+    def _init_replay_bar(self):
+        # 回放控制条，平时隐藏
+        self.replay_bar = tk.Frame(self.root, pady=4)
+
+        self.btn_replay_play = tk.Button(self.replay_bar, text="⏸", width=3, command=self.replay_toggle_play)
+        self.btn_replay_play.pack(side=tk.LEFT, padx=2)
+        tk.Button(self.replay_bar, text="⏮", width=3, command=lambda: self.replay_step(-1)).pack(side=tk.LEFT, padx=2)
+        tk.Button(self.replay_bar, text="⏭", width=3, command=lambda: self.replay_step(1)).pack(side=tk.LEFT, padx=2)
+
+        self.var_replay_speed = tk.StringVar(value="1x")
+        combo_speed = ttk.Combobox(self.replay_bar, textvariable=self.var_replay_speed, state="readonly", width=6,
+                                   values=[f"{s:g}x" for s in ReplaySource.SPEEDS])
+        combo_speed.pack(side=tk.LEFT, padx=5)
+        combo_speed.bind("<<ComboboxSelected>>", self.on_replay_speed)
+
+        self.var_replay_time = tk.DoubleVar(value=0.0)
+        self.scale_replay = tk.Scale(self.replay_bar, variable=self.var_replay_time, orient=tk.HORIZONTAL,
+                                     showvalue=False, resolution=0.01, command=self.on_replay_scale)
+        self.scale_replay.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+        self.lbl_replay_time = tk.Label(self.replay_bar, text="00:00.00 / 00:00.00", font=("Consolas", 9))
+        self.lbl_replay_time.pack(side=tk.LEFT, padx=5)
+
+        tk.Button(self.replay_bar, text="退出回放", command=self.close_replay).pack(side=tk.LEFT, padx=2)
+
+    # ---------------- 局部放大 ----------------
+
+    def on_roi_press(self, i, event):
+        if self.view_maps[i]:
+            self.drags[i] = (event.x, event.y, event.x, event.y)
+
+    def on_roi_drag(self, i, event):
+        if self.drags[i]:
+            x0, y0 = self.drags[i][:2]
+            self.drags[i] = (x0, y0, event.x, event.y)
+            # 暂停回放或画面静止 (重复帧被跳过) 时没有新帧，框选框要立即重画
+            self._present(i)
+
+    def on_roi_release(self, i, event):
+        drag, self.drags[i] = self.drags[i], None
+        view = self.view_maps[i]
+        if not drag or not view:
+            return
+        # 擦掉框选框；放大成功时紧接着会按新区域重绘
+        self._present(i)
+        x0, x1 = sorted((drag[0], event.x))
+        y0, y1 = sorted((drag[1], event.y))
+        # 太小的框视为单击 (双击也会走到这里)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return
+
+        pos_x, pos_y, new_w, new_h, (rx0, ry0, rx1, ry1) = view
+
+        def to_source(x, y):
+            u = min(max((x - pos_x) / new_w, 0.0), 1.0)
+            v = min(max((y - pos_y) / new_h, 0.0), 1.0)
+            return rx0 + u * (rx1 - rx0), ry0 + v * (ry1 - ry0)
+
+        sx0, sy0 = to_source(x0, y0)
+        sx1, sy1 = to_source(x1, y1)
+        # 限制最大放大倍数
+        if sx1 - sx0 < 0.01 or sy1 - sy0 < 0.01:
+            return
+        self._set_roi(i, (sx0, sy0, sx1, sy1))
+
+    def reset_roi(self, i):
+        self.drags[i] = None
+        if self.rois[i] is not None:
+            self._set_roi(i, None)
+
+    def _set_roi(self, i, roi):
+        self.rois[i] = roi
+        self.thumb_bufs[i] = None
+        # 区域变了，下一帧即使重复也要重新显示
+        self.dup_detectors[i].force_redraw()
+        if self.replay and i in self.replay_shown:
+            del self.replay_shown[i]
+            self._replay_show(self.replay_pos)
 
     def force_rescan(self):
         if self.is_running:
@@ -257,18 +1396,43 @@ class MultiCamApp:
         try:
             # 获取设备前，强制垃圾回收一下，或者等一下
             time.sleep(0.2)
-            graph = FilterGraph()
-            devices = graph.get_input_devices()
-            self.devices_dict = {}
-            for i, name in enumerate(devices):
-                display_name = f"{i}: {name}"
-                self.devices_dict[display_name] = i
-            
-            for cfg in self.configs:
-                cfg.update_device_list(self.devices_dict)
+            self.apply_devices(enumerate_devices())
         except Exception as e:
             print(f"刷新设备列表出错: {e}")
 
+    def apply_devices(self, devices, autoselect=True):
+        self.devices_dict = devices
+        for cfg in self.configs:
+            cfg.update_device_list(self.devices_dict, autoselect)
+        if any(self.profile_entries):
+            self._check_profile_devices()
+
+    def refresh_devices_background(self, on_done=None):
+        """在工作线程中枚举设备，完成后回到 Tk 主线程更新列表 (不自动选择)"""
+        result = {}
+
+        def worker():
+            try:
+                result["devices"] = enumerate_devices()
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+
+        def poll():
+            if thread.is_alive():
+                self.root.after(100, poll)
+                return
+            if "error" in result:
+                print(f"刷新设备列表出错: {result['error']}")
+                return
+            self.apply_devices(result["devices"], autoselect=False)
+            if on_done:
+                on_done()
+
+        self.root.after(100, poll)
+
     def toggle_cameras(self):
         if self.is_running:
             self.stop_cameras()
@@ -277,58 +1441,317 @@ class MultiCamApp:
             self.btn_toggle.config(state="disabled")
             self.root.after(200, self.start_cameras)
 
-    def start_cameras(self):
+    def _prepare_start(self):
+        if self.replay:
+            self.close_replay()
         self.is_running = True
         self.btn_toggle.config(text="⏹ 停止所有", bg="#C62828", state="normal")
+        # 每次启动开始新的时序记录，报告覆盖整个会话
+        self.timing.reset()
+
+    def _finish_start(self, active_count, t0, notify=True):
+        self.last_start_ms = (time.perf_counter() - t0) * 1000.0
+        print(f"启动耗时 {self.last_start_ms:.0f} ms")
+        if active_count > 0:
+            self.btn_record.config(state="normal")
+            self.btn_save_profile.config(state="normal")
+            self.update_loop()
+        else:
+            if self.is_running: # 如果原本想运行但一个都没打开
+                self.stop_cameras()
+                if notify:
+                    messagebox.showwarning("提示", "未能成功打开任何摄像头。\n请检查是否被其他程序占用。")
+
+    def start_cameras(self, notify=True):
+        self._prepare_start()
+        t0 = time.perf_counter()
         
         active_count = 0
         for i, cfg in enumerate(self.configs):
             settings = cfg.get_config()
             if settings:
-                # 开启线程去启动摄像头，避免 UI 卡死
-                # 注意：这里为了简化逻辑，依然在主线程循环启动，但加入 Retry
-                try:
-                    cap = cv2.VideoCapture()
-                    # --- 启动时的重试逻辑 ---
-                    opened = False
-                    for attempt in range(3):
-                        cap.open(settings['id'], cv2.CAP_DSHOW)
-                        if cap.isOpened():
-                            opened = True
-                            break
-                        time.sleep(0.3) # 失败重试延时
-                    
-                    if opened:
-                        if settings['fourcc']:
-                            cap.set(cv2.CAP_PROP_FOURCC, settings['fourcc'])
-                        cap.set(cv2.CAP_PROP_FRAME_WIDTH, settings['width'])
-                        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, settings['height'])
-                        cap.read() 
-
-                        self.caps[i] = cap
-                        active_count += 1
-                    else:
-                        self.video_labels[i].config(text="占用/打开失败", fg="red")
-                except Exception as e:
-                    print(f"Cam {i} error: {e}")
+                if self._open_channel(i, settings):
+                    active_count += 1
             else:
                 self.video_labels[i].config(text="已禁用", fg="#444", image='')
 
-        if active_count > 0:
-            self.update_loop()
-        else:
-            if self.is_running: # 如果原本想运行但一个都没打开
-                self.stop_cameras()
-                messagebox.showwarning("提示", "未能成功打开任何摄像头。\n请检查是否被其他程序占用。")
+        self._finish_start(active_count, t0, notify)
+
+    def _open_channel(self, i, settings):
+        """完整启动路径：带重试的打开、设置参数并读一帧确认"""
+        # 注意：这里为了简化逻辑，依然在主线程循环启动，但加入 Retry
+        try:
+            cap = cv2.VideoCapture()
+            # --- 启动时的重试逻辑 ---
+            opened = False
+            for attempt in range(3):
+                cap.open(settings['id'], cv2.CAP_DSHOW)
+                if cap.isOpened():
+                    opened = True
+                    break
+                time.sleep(0.3) # 失败重试延时
+            
+            if opened:
+                if settings['fourcc']:
+                    cap.set(cv2.CAP_PROP_FOURCC, settings['fourcc'])
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, settings['width'])
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, settings['height'])
+                pool = FramePool(settings['width'], settings['height'])
+                ret, buf = pool.read(cap)
+                if buf:
+                    buf.release()
+
+                self.caps[i] = cap
+                self.frame_pools[i] = pool
+                self.channel_settings[i] = settings
+                return True
+            else:
+                self.video_labels[i].config(text="占用/打开失败", fg="red")
+        except Exception as e:
+            print(f"Cam {i} error: {e}")
+        return False
+
+    @staticmethod
+    def _open_profile_capture(entry):
+        """按配置档参数打开设备，不碰界面，可在工作线程中调用；失败返回 None"""
+        params = [cv2.CAP_PROP_FRAME_WIDTH, entry['width'], cv2.CAP_PROP_FRAME_HEIGHT, entry['height']]
+        if entry['fourcc']:
+            params = [cv2.CAP_PROP_FOURCC, entry['fourcc']] + params
+        try:
+            # 参数随打开一起传入，驱动直接按目标格式建图，不必先按默认格式建好再逐个 set 重建
+            cap = cv2.VideoCapture(entry['id'], cv2.CAP_DSHOW, params)
+        except TypeError:
+            # OpenCV 4.5.2 之前没有打开参数，退回打开后设置，设备已满足的参数不再设置
+            cap = cv2.VideoCapture(entry['id'], cv2.CAP_DSHOW)
+            if cap.isOpened():
+                if entry['fourcc'] and int(cap.get(cv2.CAP_PROP_FOURCC)) != entry['fourcc']:
+                    cap.set(cv2.CAP_PROP_FOURCC, entry['fourcc'])
+                if (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) != entry['width']
+                        or int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) != entry['height']):
+                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, entry['width'])
+                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, entry['height'])
+        except Exception as e:
+            print(f"设备 {entry['id']} 快速启动失败: {e}")
+            return None
+        if not cap.isOpened():
+            cap.release()
+            return None
+        return cap
+
+    def _open_channels_fast(self, entries):
+        """快速启动路径：各通道在工作线程中同时打开，不重试不预读，首帧到达时再验证。
+        entries 为 [(通道, 配置档条目)]，返回成功打开的通道数"""
+        caps = {}
+
+        def worker(i, entry):
+            caps[i] = self._open_profile_capture(entry)
+
+        # 不同设备的建图互不依赖，并行打开后总耗时约等于最慢的一路
+        threads = [threading.Thread(target=worker, args=(i, entry), daemon=True) for i, entry in entries]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        active = 0
+        for i, entry in entries:
+            cap = caps.get(i)
+            if cap is None:
+                # 退回带重试的完整路径，需要更新界面，留在主线程
+                if self._fallback_channel(i, entry):
+                    active += 1
+                continue
+            frame_h, frame_w = entry.get('frame_shape') or (entry['height'], entry['width'])
+            self.caps[i] = cap
+            self.frame_pools[i] = FramePool(frame_w, frame_h)
+            self.channel_settings[i] = entry
+            self.pending_verify[i] = ((frame_h, frame_w), time.perf_counter() + 2.0)
+            active += 1
+        return active
+
+    def _fallback_channel(self, i, settings):
+        """配置档参数失效时退回完整启动路径"""
+        self.pending_verify[i] = None
+        if self.caps[i]:
+            self.caps[i].release()
+            self.caps[i] = None
+        self.frame_pools[i] = None
+        self.raw_decode[i] = False
+        self.thumb_bufs[i] = None
+        self.dup_detectors[i].reset()
+        self.configs[i].lbl_status.config(text="配置档失效，完整启动", fg="orange")
+        return self._open_channel(i, settings)
+
+    def _verify_channel(self, i, ret, buf):
+        """快速启动通道的延迟验证：首帧尺寸符合预期即通过，否则超时后退回完整路径"""
+        expected, deadline = self.pending_verify[i]
+        if ret and buf.array.shape[:2] == tuple(expected):
+            self.pending_verify[i] = None
+            if self.profile_entries[i]:
+                # 尺寸对了但设备名还没核对 (枚举在后台进行)
+                self.configs[i].lbl_status.config(text="首帧正常，核对设备中", fg="orange")
+            else:
+                self.configs[i].lbl_status.config(text="配置档已验证", fg="green")
+        elif ret or time.perf_counter() > deadline:
+            settings = self.channel_settings[i]
+            if not self._fallback_channel(i, settings):
+                self.configs[i].lbl_status.config(text="打开失败", fg="red")
+
+    def warm_start(self, name=None, notify=True):
+        name = name or self.var_profile.get()
+        profile = ProfileManager.load_profiles().get(name)
+        if not profile:
+            if not notify:
+                raise ValueError(f"配置档不存在: {name}")
+            messagebox.showinfo("提示", "请先选择一个配置档。")
+            return
+        if self.is_running:
+            self.stop_cameras()
+        self._prepare_start()
+        t0 = time.perf_counter()
+
+        entries = profile.get("channels", [])
+        to_open = []
+        used_ids = set()
+        for i, cfg in enumerate(self.configs):
+            entry = entries[i] if i < len(entries) else None
+            if entry and self.devices_dict:
+                # 设备列表已知时先按名称校正编号，避免打开错误的摄像头
+                entry = self._match_profile_device(i, entry, used_ids)
+                if entry is None:
+                    cfg.lbl_status.config(text="配置档设备不存在", fg="red")
+                    self.video_labels[i].config(text="设备不存在", fg="red", image='')
+                    continue
+            cfg.apply_profile_entry(entry)
+            if entry:
+                used_ids.add(entry['id'])
+                # 设备名已核对过则不再需要后台核对
+                self.profile_entries[i] = None if self.devices_dict else entry
+                to_open.append((i, entry))
+            else:
+                self.video_labels[i].config(text="已禁用", fg="#444", image='')
+
+        active_count = self._open_channels_fast(to_open)
+        self._finish_start(active_count, t0, notify)
+
+    def launch_profile(self, name):
+        """启动参数 --profile：跳过启动时的设备枚举和面板选择，直接按配置档打开"""
+        try:
+            self.warm_start(name, notify=False)
+        except ValueError as e:
+            print(e)
+            self.refresh_devices()
+            return
+        self.refresh_devices_background()
+
+    def _match_profile_device(self, i, entry, used_ids):
+        """在当前设备列表中找配置档记录的设备：编号对应的名称一致则原样返回，
+        否则按名称找到未被其他通道占用的新编号；找不到返回 None"""
+        expected = device_base_name(entry['device'])
+        for name, dev_id in self.devices_dict.items():
+            if dev_id == entry['id'] and device_base_name(name) == expected:
+                return entry
+        for name, dev_id in self.devices_dict.items():
+            if device_base_name(name) == expected and dev_id not in used_ids:
+                print(f"通道 {i+1}: 设备顺序已变化，{entry['device']} -> {name}")
+                return dict(entry, id=dev_id, device=name)
+        return None
+
+    def _check_profile_devices(self):
+        """后台枚举完成后核对各通道打开的是否是配置档记录的设备"""
+        used_ids = {self.channel_settings[k]['id'] for k in range(4)
+                    if self.channel_settings[k] and not self.profile_entries[k]}
+        moved = []
+        for i in range(4):
+            entry, self.profile_entries[i] = self.profile_entries[i], None
+            if not entry or not self.caps[i]:
+                continue
+            matched = self._match_profile_device(i, entry, used_ids)
+            if matched is entry:
+                used_ids.add(entry['id'])
+                if not self.pending_verify[i]:
+                    self.configs[i].lbl_status.config(text="配置档已验证", fg="green")
+                continue
+            if matched is None:
+                # 记录的设备已不在，关掉该通道而不是显示别的摄像头
+                self.caps[i].release()
+                self.caps[i] = None
+                self.frame_pools[i] = None
+                self.pending_verify[i] = None
+                self.configs[i].lbl_status.config(text="配置档设备不存在", fg="red")
+                self.video_labels[i].config(text="设备不存在", fg="red", image='')
+                continue
+            used_ids.add(matched['id'])
+            # 先释放，等所有需要换编号的通道都放开设备后再统一重开；
+            # 两路设备编号互换时，否则会去打开另一路还占着的设备
+            self.caps[i].release()
+            self.caps[i] = None
+            moved.append((i, matched))
+        for i, matched in moved:
+            self.configs[i].set_selection(matched['device'], matched['res'])
+            if not self._fallback_channel(i, matched):
+                self.configs[i].lbl_status.config(text="打开失败", fg="red")
+
+    def refresh_profiles(self):
+        names = sorted(ProfileManager.load_profiles().keys())
+        self.combo_profile['values'] = names
+        if names and self.var_profile.get() not in names:
+            self.combo_profile.current(0)
+
+    def save_profile(self):
+        """把当前运行中各通道的设备映射和实际生效的参数保存为配置档"""
+        entries = []
+        for i in range(4):
+            settings = self.channel_settings[i]
+            pool = self.frame_pools[i]
+            if not settings or not pool or self.pending_verify[i]:
+                entries.append(None)
+                continue
+            entries.append({
+                "device": self.configs[i].var_device.get(),
+                "res": self.configs[i].var_res.get(),
+                "id": settings['id'],
+                "fourcc": settings['fourcc'],
+                "width": settings['width'],
+                "height": settings['height'],
+                "frame_shape": list(pool.shape[:2]),
+            })
+        if not any(entries):
+            return
+        name = simpledialog.askstring("保存配置档", "配置档名称:", initialvalue=self.var_profile.get(), parent=self.root)
+        if not name:
+            return
+        ProfileManager.save_profile(name, {"saved": time.strftime("%Y-%m-%d %H:%M:%S"), "channels": entries})
+        self.refresh_profiles()
+        self.var_profile.set(name)
 
     def stop_cameras(self):
         self.is_running = False
+        if self._loop_job:
+            # 取消已排队的刷新，快速停止/启动时不会叠加出两条刷新循环
+            self.root.after_cancel(self._loop_job)
+            self._loop_job = None
         self.btn_toggle.config(text="▶ 启动选中设备", bg="#2E7D32")
+        if self.recorder:
+            self.toggle_recording()
+        self.btn_record.config(state="disabled")
+        self.btn_save_profile.config(state="disabled")
         for i in range(4):
             if self.caps[i]:
                 # 释放资源
                 self.caps[i].release()
                 self.caps[i] = None
+            self.frame_pools[i] = None
+            self.rgb_bufs[i] = None
+            self.view_imgs[i] = None
+            self.channel_settings[i] = None
+            self.pending_verify[i] = None
+            self.profile_entries[i] = None
+            self.thumb_bufs[i] = None
+            self.raw_decode[i] = False
+            self.raw_supported[i] = True
+            self.dup_detectors[i].reset()
+            self.stats[i].reset()
             self.video_labels[i].config(image='', text=f"通道 {i+1} 待机")
 
     def update_loop(self):
@@ -337,46 +1760,544 @@ class MultiCamApp:
 
         for i in range(4):
             cap = self.caps[i]
-            if cap and cap.isOpened():
+            pool = self.frame_pools[i]
+            if cap and pool and cap.isOpened():
                 try:
-                    ret, frame = cap.read()
+                    if self._is_thumbnail(i):
+                        self._poll_thumbnail(i, cap)
+                        continue
+                    if self._use_roi_decode(i):
+                        self._poll_decoded(i, cap, time.perf_counter(), reduced=False)
+                        continue
+                    self._set_raw_decode(i, False)
+                    detector = self.dup_detectors[i]
+                    t0 = time.perf_counter()
+                    ret, buf = cap.grab(), None
+                    t_cap = time.perf_counter()
+                    ts_dup = detector.check_timestamp(cap) if ret else None
+                    if ts_dup:
+                        # 驱动时间戳未变：重复帧，连 retrieve 都省掉
+                        self.timing.record_duplicate(i)
+                        self.stats[i].on_duplicate(time.perf_counter() - t0)
+                        continue
                     if ret:
-                        label_w = self.video_labels[i].winfo_width()
-                        label_h = self.video_labels[i].winfo_height()
-                        
-                        if label_w > 10 and label_h > 10:
-                            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                            img = Image.fromarray(frame)
-                            
-                            img_w, img_h = img.size
-                            ratio = min(label_w / img_w, label_h / img_h)
-                            new_w = int(img_w * ratio)
-                            new_h = int(img_h * ratio)
-                            
-                            img = img.resize((new_w, new_h), Image.Resampling.BILINEAR)
-                            
-                            final_img = Image.new('RGB', (label_w, label_h), (0, 0, 0))
-                            pos_x = (label_w - new_w) // 2
-                            pos_y = (label_h - new_h) // 2
-                            final_img.paste(img, (pos_x, pos_y))
-                            
-                            imgtk = ImageTk.PhotoImage(image=final_img)
-                            self.video_labels[i].imgtk = imgtk
-                            self.video_labels[i].config(image=imgtk, text='')
+                        ret, buf = pool.retrieve(cap)
+                    if self.pending_verify[i]:
+                        self._verify_channel(i, ret, buf)
+                        if self.caps[i] is not cap:
+                            # 已退回完整路径重新打开，这一帧作废
+                            if buf:
+                                buf.release()
+                            continue
+                    if ret and ts_dup is None and detector.check_hash(buf.array, self.rois[i]):
+                        buf.release()
+                        self.timing.record_duplicate(i)
+                        self.stats[i].on_duplicate(time.perf_counter() - t0)
+                        continue
+                    if ret:
+                        seq = self._record_capture(i, t_cap)
+                        if self.recorder and seq is not None:
+                            self.recorder.submit(i, buf)
+                        try:
+                            self._show_frame(i, buf.array, t0)
+                            if seq is not None:
+                                self.timing.record_display(i, seq, time.perf_counter())
+                        finally:
+                            # 显示完成即归还缓冲，录制/快照等使用者各自 acquire
+                            buf.release()
                     else:
                         # 偶尔读不到帧不代表断开，只是一帧丢失，不要立刻报错
                         pass 
                 except:
                     pass
 
-        self.root.after(30, self.update_loop)
+        self._loop_job = self.root.after(30, self.update_loop)
+
+    def _is_thumbnail(self, i):
+        # 录制中或首帧待验证的通道保持全速，保证录像完整；
+        # 还没有全质量耗时基准 (如聚焦模式下刚启动) 时先走一帧完整路径，节省量才有参照
+        return (self.focus_channel is not None and i != self.focus_channel
+                and not self.recorder and not self.pending_verify[i]
+                and self.stats[i].full_samples > 0)
+
+    def _thumb_interval(self):
+        try:
+            fps = float(self.var_thumb_fps.get())
+        except (tk.TclError, ValueError):
+            fps = 5.0
+        return 1.0 / min(max(fps, 0.5), 30.0)
+
+    def _set_raw_decode(self, i, raw):
+        """切换驱动端 RGB 转换；仅 MJPG 通道在缩略图/放大模式下取原始数据"""
+        settings = self.channel_settings[i]
+        mjpg = settings is not None and settings['fourcc'] == cv2.VideoWriter_fourcc(*'MJPG')
+        raw = raw and mjpg and self.raw_supported[i]
+        if raw == self.raw_decode[i]:
+            return
+        self.raw_decode[i] = raw
+        self.thumb_bufs[i] = None
+        try:
+            self.caps[i].set(cv2.CAP_PROP_CONVERT_RGB, 0 if raw else 1)
+        except:
+            pass
+
+    def _poll_thumbnail(self, i, cap):
+        """缩略图通道：未到显示时刻只 grab 丢弃旧帧，到点才取帧并低分辨率解码"""
+        t0 = time.perf_counter()
+        if t0 < self.next_thumb[i]:
+            if cap.grab():
+                # 丢弃的帧也记录采集时刻，帧间隔统计才反映摄像头本身的节奏。
+                # 时间戳不可用 (None) 时不 retrieve 就分不清新旧帧，不记录，以免把轮询节奏当成帧间隔
+                t_cap = time.perf_counter()
+                detector = self.dup_detectors[i]
+                ts_dup = detector.check_timestamp(cap)
+                if ts_dup:
+                    self.timing.record_duplicate(i)
+                    self.stats[i].on_duplicate(time.perf_counter() - t0)
+                    return
+                if ts_dup is False:
+                    self.timing.record_capture(i, detector.capture_time(t_cap))
+                self.stats[i].on_skip(time.perf_counter() - t0)
+            return
+        # 重复帧不推迟下次显示时刻，下一轮再取
+        if self._poll_decoded(i, cap, t0, reduced=True):
+            self.next_thumb[i] = t0 + self._thumb_interval()
+
+    def _use_roi_decode(self, i):
+        # 放大查看且不需要完整帧 (录制/首帧验证) 时，走按 ROI 缩小解码的路径
+        return self.rois[i] is not None and not self.recorder and not self.pending_verify[i]
+
+    def _reduce_flag(self, i, label_w, label_h):
+        """按 ROI 在源图中的实际像素数和显示尺寸，选择尽量大的 JPEG 缩小解码倍数"""
+        pool = self.frame_pools[i]
+        if pool is None:
+            return cv2.IMREAD_COLOR
+        src_h, src_w = pool.shape[:2]
+        x0, y0, x1, y1 = self.rois[i] or (0.0, 0.0, 1.0, 1.0)
+        region_w = src_w * (x1 - x0)
+        region_h = src_h * (y1 - y0)
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                             (4, cv2.IMREAD_REDUCED_COLOR_4),
+                             (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if region_w / factor >= label_w and region_h / factor >= label_h:
+                return flag
+        return cv2.IMREAD_COLOR
+
+    def _poll_decoded(self, i, cap, t0, reduced):
+        """取一帧到通道暂存缓冲并显示；MJPG 通道取原始码流自行缩小解码。返回是否显示了新帧"""
+        self._set_raw_decode(i, True)
+        if not cap.grab():
+            return False
+        t_cap = time.perf_counter()
+        detector = self.dup_detectors[i]
+        ts_dup = detector.check_timestamp(cap)
+        if not ts_dup:
+            ret, frame = cap.retrieve(self.thumb_bufs[i])
+            if not ret or frame is None:
+                return False
+            self.thumb_bufs[i] = frame
+        if ts_dup or (ts_dup is None and detector.check_hash(frame, self.rois[i])):
+            self.timing.record_duplicate(i)
+            self.stats[i].on_duplicate(time.perf_counter() - t0)
+            return False
+        seq = self._record_capture(i, t_cap)
+        if self.raw_decode[i]:
+            if frame.ndim == 3 and frame.shape[0] > 1:
+                # 驱动忽略了 CONVERT_RGB，已经是解码后的图像
+                self.raw_supported[i] = False
+                self._set_raw_decode(i, False)
+            else:
+                # 原始 MJPG 码流，按显示需要的分辨率缩小解码
+                label = self.video_labels[i]
+                flag = self._reduce_flag(i, label.winfo_width(), label.winfo_height())
+                frame = cv2.imdecode(frame.reshape(-1), flag)
+                if frame is None:
+                    self.raw_supported[i] = False
+                    self._set_raw_decode(i, False)
+                    return False
+        self._show_frame(i, frame, t0, reduced)
+        if seq is not None:
+            self.timing.record_display(i, seq, time.perf_counter())
+        return True
+
+    def _record_capture(self, i, t_cap):
+        """记录新帧的采集时刻并返回帧序号；为强制重绘而重新显示的旧帧只计为重复，返回 None"""
+        detector = self.dup_detectors[i]
+        if detector.forced_repeat:
+            self.timing.record_duplicate(i)
+            return None
+        return self.timing.record_capture(i, detector.capture_time(t_cap))
+
+    def _show_frame(self, i, frame, t0=None, reduced=False):
+        """显示并计入统计；实时采集和会话回放都走这里，t0 为读取开始时刻"""
+        if t0 is None:
+            t0 = time.perf_counter()
+        self._render_frame(i, frame, reduced)
+        self.stats[i].on_frame(time.perf_counter() - t0, reduced)
+
+    def update_telemetry(self):
+        parts = []
+        for i in range(4):
+            if self.caps[i] or i in self.replay_shown:
+                text = f"CH{i+1} {self.stats[i].summary()}"
+                if self.rois[i]:
+                    x0, y0, x1, y1 = self.rois[i]
+                    text += f" 放大 {1.0 / max(x1 - x0, y1 - y0):.1f}x"
+                parts.append(text)
+        if self.recorder:
+            if self.recorder.error:
+                parts.append(f"录制失败: {self.recorder.error}")
+            else:
+                parts.append(f"录制中 丢帧 {self.recorder.dropped}")
+        if self.is_running and self.last_start_ms is not None:
+            parts.append(f"启动 {self.last_start_ms:.0f}ms")
+        self.lbl_telemetry.config(text="  |  ".join(parts))
+        self.root.after(1000, self.update_telemetry)
+
+    def toggle_recording(self):
+        if self.recorder:
+            recorder = self.recorder
+            self.recorder = None
+            recorder.close()
+            try:
+                # 录像目录中附带本次运行的帧时序报告
+                self.timing.export(recorder.path, channels=sorted(recorder.files))
+            except Exception as e:
+                print(f"导出时序报告失败: {e}")
+            self.btn_record.config(text="● 开始录制", fg="black")
+            return
+        channels = [i for i in range(4) if self.caps[i]]
+        if not channels:
+            return
+        path = os.path.join(SESSION_DIR, time.strftime("%Y%m%d_%H%M%S"))
+        try:
+            self.recorder = SessionRecorder(path, channels)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法创建录制文件:\n{e}")
+            return
+        self.btn_record.config(text="■ 停止录制", fg="red")
+
+    def export_timing(self):
+        if not any(self.timing.count):
+            messagebox.showinfo("提示", "还没有可导出的帧时序数据。")
+            return
+        path = os.path.join(REPORT_DIR, time.strftime("%Y%m%d_%H%M%S"))
+        try:
+            self.timing.export(path)
+        except Exception as e:
+            messagebox.showerror("错误", f"导出失败:\n{e}")
+            return
+        messagebox.showinfo("提示", f"时序报告已导出到:\n{os.path.abspath(path)}")
+
+    # ---------------- 会话回放 ----------------
+
+    def open_replay(self):
+        path = filedialog.askdirectory(title="选择录像会话目录",
+                                       initialdir=SESSION_DIR if os.path.isdir(SESSION_DIR) else ".")
+        if not path:
+            return
+        try:
+            source = ReplaySource(path)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法打开会话:\n{e}")
+            return
+
+        if self.is_running:
+            self.stop_cameras()
+        if self.replay:
+            self.close_replay()
+
+        self.replay = source
+        self.replay_shown = {}
+        for i in range(4):
+            self.stats[i].reset()
+            if i not in source.channels:
+                self.video_labels[i].config(image='', text=f"通道 {i+1} 无录像")
+        self.scale_replay.config(from_=0.0, to=max(source.end - source.start, 0.01))
+        self.replay_bar.pack(side=tk.BOTTOM, fill=tk.X, before=self.status_bar)
+        self.replay_seek(source.start)
+        self.replay_set_playing(True)
+        self.replay_loop()
+
+    def close_replay(self):
+        if self._replay_job:
+            # 取消已排队的回放刷新，重新打开会话时不会叠加出多条循环
+            self.root.after_cancel(self._replay_job)
+            self._replay_job = None
+        if self.replay:
+            self.replay.close()
+        self.replay = None
+        self.replay_playing = False
+        self.replay_shown = {}
+        self.replay_bar.pack_forget()
+        for i in range(4):
+            self.stats[i].reset()
+            self.view_imgs[i] = None
+            self.video_labels[i].config(image='', text=f"通道 {i+1} 待机")
+
+    def replay_loop(self):
+        if not self.replay:
+            return
+        if self.replay_playing:
+            t = self.replay_origin + (time.perf_counter() - self.replay_wall) * self.replay_speed
+            if t >= self.replay.end:
+                t = self.replay.end
+                self.replay_set_playing(False)
+            self._replay_show(t)
+        self._replay_job = self.root.after(15, self.replay_loop)
+
+    def _replay_show(self, t):
+        """把各通道在时刻 t 应显示的帧送入显示路径，未变化的通道不重复解码"""
+        self.replay_pos = t
+        for ch, k in self.replay.frames_at(t).items():
+            if self.replay_shown.get(ch) == k:
+                continue
+            frame = self.replay.decode(ch, k)
+            if frame is not None:
+                self._show_frame(ch, frame)
+            self.replay_shown[ch] = k
+
+        rel = t - self.replay.start
+        total = self.replay.end - self.replay.start
+        self.var_replay_time.set(rel)
+        self.lbl_replay_time.config(text=f"{self._fmt_time(rel)} / {self._fmt_time(total)}")
+
+    @staticmethod
+    def _fmt_time(seconds):
+        m, s = divmod(max(seconds, 0.0), 60)
+        return f"{int(m):02d}:{s:05.2f}"
+
+    def replay_seek(self, t):
+        t = min(max(t, self.replay.start), self.replay.end)
+        self.replay_origin = t
+        self.replay_wall = time.perf_counter()
+        self._replay_show(t)
+
+    def replay_set_playing(self, playing):
+        self.replay_playing = playing
+        # 从当前位置重新计时，暂停/调速后不会跳帧
+        self.replay_origin = self.replay_pos
+        self.replay_wall = time.perf_counter()
+        self.btn_replay_play.config(text="⏸" if playing else "▶")
+
+    def replay_toggle_play(self):
+        if not self.replay:
+            return
+        if not self.replay_playing and self.replay_pos >= self.replay.end:
+            self.replay_seek(self.replay.start)
+        self.replay_set_playing(not self.replay_playing)
+
+    def replay_step(self, direction):
+        """所有通道一起前进/后退一帧"""
+        if not self.replay:
+            return
+        self.replay_set_playing(False)
+        if direction > 0:
+            t = self.replay.next_time(self.replay_pos)
+        else:
+            t = self.replay.prev_time(self.replay_pos)
+        if t is not None:
+            self.replay_seek(t)
+
+    def on_replay_speed(self, event):
+        self.replay_speed = float(self.var_replay_speed.get().rstrip("x"))
+        self.replay_set_playing(self.replay_playing)
+
+    def on_replay_scale(self, value):
+        if not self.replay:
+            return
+        # 播放时进度条跟随也会触发回调，只有用户拖动 (偏差超过刻度) 才跳转
+        t = self.replay.start + float(value)
+        if abs(t - self.replay_pos) > 0.01:
+            self.replay_seek(t)
+
+    def _render_frame(self, i, frame, reduced=False):
+        """把一帧 BGR 图像按比例缩放后显示到第 i 路画面"""
+        label_w = self.video_labels[i].winfo_width()
+        label_h = self.video_labels[i].winfo_height()
+        if label_w <= 10 or label_h <= 10:
+            return
+
+        # 先裁剪出放大区域 (只是视图，不复制)，后续缩放和转色都只处理这一块
+        roi = self.rois[i] or (0.0, 0.0, 1.0, 1.0)
+        frame = crop_roi(frame, self.rois[i])
+
+        img_h, img_w = frame.shape[:2]
+        if reduced:
+            # 缩略图先隔行隔列抽取，再做面积插值，省掉大部分缩放计算
+            step = min(img_w // label_w, img_h // label_h)
+            if step >= 2:
+                frame = frame[::step, ::step]
+                img_h, img_w = frame.shape[:2]
+
+        ratio = min(label_w / img_w, label_h / img_h)
+        new_w = max(int(img_w * ratio), 1)
+        new_h = max(int(img_h * ratio), 1)
+
+        # 先缩放再转色，转换只处理显示尺寸的像素
+        interp = cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR
+        small = cv2.resize(frame, (new_w, new_h), interpolation=interp)
+        pos_x = (label_w - new_w) // 2
+        pos_y = (label_h - new_h) // 2
+        small = cv2.copyMakeBorder(small, pos_y, label_h - new_h - pos_y, pos_x, label_w - new_w - pos_x,
+                                   cv2.BORDER_CONSTANT, value=(0, 0, 0))
+        self.view_maps[i] = (pos_x, pos_y, new_w, new_h, roi)
+        self.view_imgs[i] = small
+        self._present(i)
+
+    def _present(self, i):
+        """把最近一次的标签尺寸画面叠加框选框后送到第 i 路标签"""
+        small = self.view_imgs[i]
+        if small is None:
+            return
+        if self.drags[i]:
+            # 在副本上画框，保留干净的画面供拖拽中反复重画
+            small = small.copy()
+            x0, y0, x1, y1 = self.drags[i]
+            cv2.rectangle(small, (x0, y0), (x1, y1), (0, 255, 255), 1)
+
+        # 颜色转换写入通道内复用的 RGB 缓冲
+        self.rgb_bufs[i] = cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=self.rgb_bufs[i])
+        final_img = Image.fromarray(self.rgb_bufs[i])
+        
+        imgtk = ImageTk.PhotoImage(image=final_img)
+        self.video_labels[i].imgtk = imgtk
+        self.video_labels[i].config(image=imgtk, text='')
+
+    # ---------------- 控制接口 (在 Tk 主线程中执行) ----------------
+
+    def api_list_devices(self):
+        return [{"name": name, "id": dev_id} for name, dev_id in self.devices_dict.items()]
+
+    RES_PATTERN = re.compile(r"^(MJPG|YUY2|默认) \d+x\d+$")
+
+    def api_apply_config(self, channels):
+        """channels: [{"channel": 0-3, "enabled": bool, "device": 名称或编号, "res": "MJPG 1920x1080"}]
+
+        先校验全部条目再统一应用，任何一条不合法都不改动界面。
+        """
+        if not isinstance(channels, list):
+            raise InvalidParams("channels 必须是数组")
+        changes = []
+        for item in channels:
+            if not isinstance(item, dict):
+                raise InvalidParams(f"通道配置必须是对象: {item!r}")
+            try:
+                i = int(item["channel"])
+            except (KeyError, TypeError, ValueError):
+                raise InvalidParams(f"缺少或无效的通道编号: {item!r}")
+            if not 0 <= i < 4:
+                raise InvalidParams(f"通道编号超出范围: {i}")
+            if not item.get("enabled", True):
+                changes.append((i, None, None))
+                continue
+            res = item.get("res")
+            # 格式不对时 get_config 会悄悄退回 640x480，这里提前拒绝
+            if not isinstance(res, str) or not self.RES_PATTERN.match(res):
+                raise InvalidParams(f"通道 {i} 分辨率格式应为 \"MJPG|YUY2|默认 宽x高\": {res!r}")
+            changes.append((i, self._resolve_device(item.get("device")), res))
+
+        for i, device, res in changes:
+            if device is None:
+                self.configs[i].var_enable.set(False)
+            else:
+                self.configs[i].set_selection(device, res)
+        return self.api_get_config()
+
+    def _resolve_device(self, device):
+        # 支持完整显示名 "0: xxx"、设备名或设备编号
+        for name, dev_id in self.devices_dict.items():
+            if device in (name, dev_id) or device_base_name(name) == device:
+                return name
+        raise InvalidParams(f"未找到设备: {device}")
+
+    def api_get_config(self):
+        return [{"channel": i,
+                 "enabled": cfg.var_enable.get(),
+                 "device": cfg.var_device.get(),
+                 "res": cfg.var_res.get()} for i, cfg in enumerate(self.configs)]
+
+    def api_start(self, profile=None):
+        if not self.is_running:
+            if profile:
+                self.warm_start(profile, notify=False)
+            else:
+                self.start_cameras(notify=False)
+        return {"running": self.is_running,
+                "channels": [i for i in range(4) if self.caps[i]],
+                "start_ms": self.last_start_ms}
+
+    def api_stop(self):
+        t0 = time.perf_counter()
+        if self.is_running:
+            self.stop_cameras()
+        return {"running": self.is_running, "stop_ms": (time.perf_counter() - t0) * 1000.0}
+
+    def api_grab_snapshot(self):
+        """先对所有通道连续 grab 再逐个 retrieve，使各路画面时刻尽量一致；调用方负责 release"""
+        grabbed = []
+        for i in range(4):
+            cap, pool = self.caps[i], self.frame_pools[i]
+            if cap and pool:
+                self._set_raw_decode(i, False)
+                if cap.grab():
+                    grabbed.append((i, cap, pool, time.perf_counter()))
+        frames = []
+        for i, cap, pool, ts in grabbed:
+            ret, buf = pool.retrieve(cap)
+            if ret:
+                buf.timestamp = ts
+                frames.append((i, buf))
+        return frames
+
+    def api_timing_report(self, path=None):
+        """帧时序摘要；给出 path 时同时导出 CSV/JSON"""
+        reports = []
+        for ch in range(4):
+            if self.timing.count[ch]:
+                r = self.timing.report(ch)
+                reports.append({k: v for k, v in r.items() if not k.endswith("_hist")})
+        result = {"channels": reports}
+        if path:
+            result["path"] = self.timing.export(path)
+        return result
+
+    def api_stats(self):
+        channels = []
+        for i in range(4):
+            item = {"channel": i, "active": self.caps[i] is not None}
+            pool = self.frame_pools[i]
+            # 池内累计分配的缓冲数，长时间运行应保持不变
+            item["pool_allocated"] = pool.allocated if pool else 0
+            item.update(self.stats[i].as_dict())
+            channels.append(item)
+        return {"running": self.is_running,
+                "recording": self.recorder is not None,
+                "focus_channel": self.focus_channel,
+                "last_start_ms": self.last_start_ms,
+                "channels": channels}
 
     def on_close(self):
+        if self.control:
+            self.control.stop()
         self.stop_cameras()
+        if self.replay:
+            self.close_replay()
         self.root.destroy()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多路摄像头监控")
+    parser.add_argument("--control-port", type=int, default=None, help="在 127.0.0.1 上开启 JSON-RPC 控制接口的端口")
+    parser.add_argument("--control-socket", default=None, help="JSON-RPC 控制接口的 Unix socket 路径 (Windows 不支持，请用 --control-port)")
+    parser.add_argument("--profile", default=None, help="启动后直接按该配置档打开摄像头")
+    args = parser.parse_args()
+    if args.control_socket and not hasattr(socket, "AF_UNIX"):
+        parser.error("当前系统不支持 Unix socket，请改用 --control-port")
+
     root = tk.Tk()
-    app = MultiCamApp(root)
+    app = MultiCamApp(root, profile=args.profile)
+    if args.control_port is not None or args.control_socket:
+        app.control = ControlServer(app, port=args.control_port, unix_path=args.control_socket)
+        app.control.start()
     root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
\ No newline at end of file